@@ -0,0 +1,216 @@
+"""
+Index en mémoire des aéroports pour l'autocomplétion et la résolution des villes.
+Charge le jeu de données fourni (data/airports.csv) une seule fois au démarrage
+et précalcule un trie de préfixes sur les textes normalisés (sans accents ni casse).
+"""
+
+from typing import Dict, List, Optional
+from difflib import get_close_matches
+import csv
+import os
+import re
+import unicodedata
+
+
+# Jeu de données fourni avec l'application
+AIRPORTS_CSV = os.path.join(os.path.dirname(__file__), "data", "airports.csv")
+
+# Priorité des types de correspondance (plus petit = plus pertinent)
+MATCH_CODE = 0
+MATCH_CITY = 1
+MATCH_ALIAS = 2
+MATCH_NAME = 3
+MATCH_WORD = 4
+
+# Nombre maximum de suggestions conservées par nœud du trie
+MAX_SUGGESTIONS = 10
+
+# Longueur minimale d'une saisie pour les suggestions approximatives
+FUZZY_MIN_LENGTH = 4
+
+# Taille maximale du cache de recherche approximative
+FUZZY_CACHE_SIZE = 4096
+
+
+def fold(text: str) -> str:
+    """
+    Normalise un texte pour la recherche : supprime les accents, la casse
+    et la ponctuation ("Zürich" -> "zurich", "Tel-Aviv" -> "tel aviv").
+    """
+    decomposed = unicodedata.normalize("NFKD", text)
+    stripped = "".join(c for c in decomposed if not unicodedata.combining(c))
+    return re.sub(r"[^0-9a-z]+", " ", stripped.casefold()).strip()
+
+
+class _TrieNode:
+    """Nœud du trie : enfants par caractère et meilleurs aéroports du sous-arbre."""
+
+    __slots__ = ("children", "matches")
+
+    def __init__(self):
+        self.children: Dict[str, "_TrieNode"] = {}
+        self.matches = {}
+
+
+class AirportIndex:
+    """
+    Index des aéroports avec recherche par préfixe, résolution exacte
+    et suggestions approximatives pour les fautes de frappe.
+    """
+
+    def __init__(self, airports: List[Dict]):
+        """
+        Construit l'index. L'ordre des aéroports définit la priorité
+        entre aéroports d'une même ville (le premier est l'aéroport principal).
+
+        Args:
+            airports: Liste de dictionnaires avec iata, name, city, country, aliases
+        """
+        self.airports = []
+        self._root = _TrieNode()
+        self._exact: Dict[str, tuple] = {}
+        self._fuzzy_cache: Dict[tuple, List[Dict]] = {}
+
+        for position, row in enumerate(airports):
+            airport = {
+                "iata": row["iata"].strip().upper(),
+                "name": row["name"].strip(),
+                "city": row["city"].strip(),
+                "country": row["country"].strip()
+            }
+            self.airports.append(airport)
+
+            aliases = [a for a in (row.get("aliases") or "").split("|") if a.strip()]
+            keys = [(airport["iata"], MATCH_CODE), (airport["city"], MATCH_CITY)]
+            keys += [(alias, MATCH_ALIAS) for alias in aliases]
+            keys.append((airport["name"], MATCH_NAME))
+
+            for text, match_type in keys:
+                key = fold(text)
+                if not key:
+                    continue
+                self._insert(key, position, match_type)
+                self._add_exact(key, position, match_type)
+
+                # Permettre la recherche sur chaque mot ("gaulle" -> CDG)
+                for word in key.split()[1:]:
+                    self._insert(word, position, MATCH_WORD)
+
+        self._freeze(self._root)
+
+        # Candidats de la recherche approximative regroupés par première lettre
+        self._fuzzy_candidates: Dict[str, List[str]] = {}
+        for key in self._exact:
+            self._fuzzy_candidates.setdefault(key[0], []).append(key)
+
+
+    @classmethod
+    def from_csv(cls, path: str = AIRPORTS_CSV) -> "AirportIndex":
+        """Charge l'index depuis un fichier CSV."""
+        with open(path, encoding="utf-8", newline="") as f:
+            return cls(list(csv.DictReader(f)))
+
+
+    def suggest(self, query: str, limit: int = 8) -> List[Dict]:
+        """
+        Retourne les aéroports dont un code, une ville, un alias ou un mot
+        du nom commence par la requête. Si aucun préfixe ne correspond,
+        utilise une recherche approximative (à partir de FUZZY_MIN_LENGTH caractères).
+
+        Args:
+            query: Texte saisi par l'utilisateur
+            limit: Nombre maximum de suggestions
+
+        Returns:
+            Liste d'aéroports triés par pertinence
+        """
+        key = fold(query)
+        if not key:
+            return []
+
+        node = self._root
+        for char in key:
+            node = node.children.get(char)
+            if node is None:
+                if len(key) < FUZZY_MIN_LENGTH:
+                    return []
+                return self._fuzzy(key, limit)
+
+        return [self.airports[position] for position in node.matches[:limit]]
+
+
+    def resolve(self, query: str) -> Optional[Dict]:
+        """
+        Résout un code IATA, une ville, un alias ou un nom d'aéroport
+        vers l'aéroport correspondant (l'aéroport principal pour une ville).
+        Seules les correspondances exactes sont retenues : une ville absente
+        de l'index ne doit pas être confondue avec une ville voisine
+        ("Turin" n'est pas Tunis). Les fautes de frappe relèvent de suggest().
+
+        Returns:
+            L'aéroport trouvé, ou None si la requête est inconnue
+        """
+        match = self._exact.get(fold(query))
+        return self.airports[match[1]] if match is not None else None
+
+
+    def canonicalize(self, query: str) -> str:
+        """
+        Normalise un lieu saisi en code IATA.
+        Retourne la saisie nettoyée si le lieu est inconnu.
+        """
+        airport = self.resolve(query)
+        return airport["iata"] if airport else query.strip()
+
+
+    def _insert(self, key: str, position: int, match_type: int):
+        """Ajoute un aéroport sur tout le chemin du trie correspondant à la clé."""
+        node = self._root
+        for char in key:
+            node = node.children.setdefault(char, _TrieNode())
+            best = node.matches.get(position)
+            if best is None or match_type < best:
+                node.matches[position] = match_type
+
+
+    def _add_exact(self, key: str, position: int, match_type: int):
+        """Conserve l'aéroport le plus pertinent pour une clé exacte."""
+        candidate = (match_type, position)
+        if key not in self._exact or candidate < self._exact[key]:
+            self._exact[key] = candidate
+
+
+    def _freeze(self, node: _TrieNode):
+        """Trie et tronque une fois pour toutes les suggestions de chaque nœud."""
+        ranked = sorted(node.matches.items(), key=lambda item: (item[1], item[0]))
+        node.matches = [position for position, _ in ranked[:MAX_SUGGESTIONS]]
+        for child in node.children.values():
+            self._freeze(child)
+
+
+    def _fuzzy(self, key: str, limit: int) -> List[Dict]:
+        """
+        Recherche approximative sur les clés exactes (fautes de frappe).
+        Seules les clés commençant par la même lettre sont comparées,
+        et les résultats sont mis en cache pour les saisies répétées.
+        """
+        cache_key = (key, limit)
+        if cache_key in self._fuzzy_cache:
+            return self._fuzzy_cache[cache_key]
+
+        candidates = self._fuzzy_candidates.get(key[0], [])
+        results = []
+        for close_key in get_close_matches(key, candidates, n=limit, cutoff=0.75):
+            airport = self.airports[self._exact[close_key][1]]
+            if airport not in results:
+                results.append(airport)
+
+        if len(self._fuzzy_cache) >= FUZZY_CACHE_SIZE:
+            self._fuzzy_cache.clear()
+        self._fuzzy_cache[cache_key] = results
+
+        return results
+
+
+# Instance globale de l'index
+airport_index = AirportIndex.from_csv()
@@ -20,6 +20,14 @@ class Settings(BaseSettings):
     
     # OpenAI Configuration
     openai_api_key: str = ""
+    llm_structured_output: bool = True  # Sortie contrainte par schéma (function calling)
+    llm_model: str = "gpt-3.5-turbo"  # Modèle complet pour les classements ambigus
+    llm_fast_model: str = "gpt-4o-mini"  # Modèle rapide et économique pour les cas intermédiaires
+    
+    # Routage selon la confiance du classement déterministe (entre 0 et 1)
+    router_enabled: bool = True
+    router_deterministic_threshold: float = 0.7  # Au-dessus : réponse sans appel à l'IA
+    router_fast_threshold: float = 0.4  # Au-dessus : modèle rapide, sinon modèle complet
     
     # API Keys pour les services de vols (optionnel)
     skyscanner_api_key: Optional[str] = None
@@ -31,6 +39,18 @@ class Settings(BaseSettings):
     host: str = "0.0.0.0"
     port: int = 8000
     
+    # Surveillance des prix (watch_route)
+    price_watch_interval: float = 30.0  # Secondes entre deux rafraîchissements d'une route
+    price_watch_top_k: int = 5  # Taille du top dont un changement relance l'analyse IA
+    
+    # Recherche et cache des résultats
+    search_cache_ttl: float = 300.0  # Durée de validité d'un résultat en cache (secondes)
+    search_cache_size: int = 1000  # Nombre maximum de routes en cache
+    
+    # Recherche en lot (POST /search/batch)
+    batch_search_concurrency: int = 8  # Recherches simultanées maximum par lot
+    batch_search_max_size: int = 500  # Nombre maximum de recherches par lot
+    
     # CORS Configuration
     allowed_origins: list = ["http://localhost:3000", "http://127.0.0.1:3000"]
     
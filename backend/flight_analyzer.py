@@ -5,10 +5,54 @@ Analyse les offres de vols et fournit des recommandations intelligentes.
 
 from typing import List, Dict
 from langchain_openai import ChatOpenAI
-from langchain.prompts import ChatPromptTemplate
-from langchain.schema.output_parser import StrOutputParser
+from langchain_core.messages import HumanMessage, SystemMessage
 from config import settings
+from metrics import metrics
+from recommendation_parser import RecommendationList, parse_recommendations
+from model_router import (
+    ModelRouter, TIER_DETERMINISTIC, TIER_FAST, TIER_FULL,
+    duration_minutes, is_preferred_airline, rank_flights
+)
 import json
+import time
+
+
+# Instructions statiques : placées en tête du prompt et jamais modifiées
+SYSTEM_PROMPT = """Tu es un expert en voyage et conseiller en réservation de vols.
+Ta mission est d'analyser les offres de vols et de recommander les 5 meilleures options.
+
+Critères de sélection:
+1. Meilleur rapport qualité/prix
+2. Durée de vol optimale
+3. Nombre d'escales (privilégier les vols directs)
+4. Horaires convenables (éviter les départs très tôt ou très tard sauf si avantageux)
+5. Compagnie aérienne réputée
+6. Services inclus (bagages, repas, WiFi)
+
+Recommande les 5 meilleures offres avec une brève explication (2-3 phrases) pour chacune.
+Fournis une analyse concise et utile pour chaque recommandation.
+
+Format de réponse attendu (JSON):
+{
+    "recommendations": [
+        {
+            "flight_id": "FL1001",
+            "rank": 1,
+            "reason": "Explication courte et claire",
+            "highlights": ["point fort 1", "point fort 2"]
+        }
+    ]
+}"""
+
+# Partie variable du prompt, la plus courte possible
+USER_PROMPT = """Critères de recherche:
+- Origine: {origin}
+- Destination: {destination}
+- Date: {date}
+- Compagnie préférée: {airline}
+
+Offres de vols disponibles:
+{flights_json}"""
 
 
 class FlightAnalyzerService:
@@ -20,52 +64,44 @@ class FlightAnalyzerService:
     def __init__(self):
         """Initialise le modèle OpenAI et le pipeline LangChain."""
         
-        # Initialiser le modèle ChatGPT
-        self.llm = ChatOpenAI(
-            model="gpt-3.5-turbo",
+        # Initialiser le modèle complet et le modèle rapide pour les cas simples
+        self.llm = self._create_llm(settings.llm_model)
+        self.fast_llm = self._create_llm(settings.llm_fast_model)
+        
+        # Préfixe statique pré-rendu une seule fois, identique à chaque appel :
+        # le fournisseur pourra réutiliser son cache de préfixe (à partir de 1024 tokens)
+        self.static_prefix = (SystemMessage(content=SYSTEM_PROMPT),)
+        
+        # Créer une chaîne LangChain par niveau de modèle
+        self.chains = {
+            TIER_FAST: self._create_chain(self.fast_llm),
+            TIER_FULL: self._create_chain(self.llm)
+        }
+        
+        # Choix du niveau selon la confiance du classement déterministe
+        self.router = ModelRouter()
+    
+    
+    def _create_llm(self, model: str) -> ChatOpenAI:
+        """Initialise un modèle ChatGPT."""
+        return ChatOpenAI(
+            model=model,
             temperature=0.3,  # Température basse pour des réponses plus déterministes
             openai_api_key=settings.openai_api_key
         )
-        
-        # Créer le prompt template pour l'analyse
-        self.prompt_template = ChatPromptTemplate.from_messages([
-            ("system", """Tu es un expert en voyage et conseiller en réservation de vols.
-            Ta mission est d'analyser les offres de vols et de recommander les 5 meilleures options.
-            
-            Critères de sélection:
-            1. Meilleur rapport qualité/prix
-            2. Durée de vol optimale
-            3. Nombre d'escales (privilégier les vols directs)
-            4. Horaires convenables (éviter les départs très tôt ou très tard sauf si avantageux)
-            5. Compagnie aérienne réputée
-            6. Services inclus (bagages, repas, WiFi)
-            
-            Fournis une analyse concise et utile pour chaque recommandation."""),
-            ("user", """Voici les critères de recherche:
-            - Origine: {origin}
-            - Destination: {destination}
-            - Date: {date}
-            - Compagnie préférée: {airline}
-            
-            Voici les offres de vols disponibles:
-            {flights_json}
-            
-            Recommande les 5 meilleures offres avec une brève explication (2-3 phrases) pour chacune.
-            Format de réponse attendu (JSON):
-            {{
-                "recommendations": [
-                    {{
-                        "flight_id": "FL1001",
-                        "rank": 1,
-                        "reason": "Explication courte et claire",
-                        "highlights": ["point fort 1", "point fort 2"]
-                    }}
-                ]
-            }}""")
-        ])
-        
-        # Créer la chaîne LangChain
-        self.chain = self.prompt_template | self.llm | StrOutputParser()
+    
+    
+    def _create_chain(self, llm: ChatOpenAI):
+        """Crée la chaîne LangChain d'analyse pour un modèle."""
+        if settings.llm_structured_output:
+            # Appel de fonction contraint par le schéma Pydantic ; la réponse brute
+            # est conservée pour récupérer ce qui peut l'être si la validation échoue
+            return llm.with_structured_output(
+                RecommendationList,
+                method="function_calling",
+                include_raw=True
+            )
+        return llm
     
     
     def analyze_flights(
@@ -90,84 +126,221 @@ class FlightAnalyzerService:
             Dictionnaire contenant les recommandations et l'analyse
         """
         
+        started = time.perf_counter()
+        
+        # Classement évident : pas d'appel à l'IA ; sinon modèle rapide ou complet
+        if settings.router_enabled:
+            tier, confidence = self.router.route(flights, airline)
+        else:
+            tier, confidence = TIER_FULL, None
+        
+        if tier == TIER_DETERMINISTIC:
+            result = self._deterministic_recommendations(flights, airline)
+        else:
+            result = self._analyze_with_llm(
+                self.chains[tier], flights, origin, destination, date, airline
+            )
+        
+        metrics.incr(f"router.{tier}")
+        metrics.observe(f"router.{tier}", time.perf_counter() - started)
+        
+        result["routing"] = {
+            "tier": tier,
+            "confidence": round(confidence, 3) if confidence is not None else None
+        }
+        return result
+    
+    
+    def _analyze_with_llm(
+        self,
+        chain,
+        flights: List[Dict],
+        origin: str,
+        destination: str,
+        date: str,
+        airline: str
+    ) -> Dict:
+        """Analyse les vols avec une chaîne LangChain et enrichit les recommandations."""
+        
         try:
-            # Convertir les vols en JSON pour le prompt
-            flights_json = json.dumps(flights, indent=2, ensure_ascii=False)
-            
             # Exécuter la chaîne LangChain
-            response = self.chain.invoke({
-                "origin": origin,
-                "destination": destination,
-                "date": date,
-                "airline": airline if airline else "Aucune préférence",
-                "flights_json": flights_json
-            })
+            started = time.perf_counter()
+            response = chain.invoke(
+                self._build_messages(flights, origin, destination, date, airline)
+            )
+            metrics.observe("llm.analysis", time.perf_counter() - started)
+            self._record_usage(response)
             
-            # Parser la réponse JSON
-            try:
-                # Extraire le JSON de la réponse
-                response_clean = response.strip()
-                if "```json" in response_clean:
-                    response_clean = response_clean.split("```json")[1].split("```")[0]
-                elif "```" in response_clean:
-                    response_clean = response_clean.split("```")[1].split("```")[0]
-                
-                analysis = json.loads(response_clean)
-                
-                # Enrichir les recommandations avec les données complètes des vols
-                enriched_recommendations = []
-                for rec in analysis.get("recommendations", [])[:5]:
-                    flight_id = rec.get("flight_id")
-                    # Trouver le vol correspondant
-                    flight_data = next(
-                        (f for f in flights if f["id"] == flight_id),
-                        None
-                    )
-                    
-                    if flight_data:
-                        enriched_recommendations.append({
-                            **flight_data,
-                            "ai_analysis": {
-                                "rank": rec.get("rank"),
-                                "reason": rec.get("reason"),
-                                "highlights": rec.get("highlights", [])
-                            }
-                        })
-                
-                return {
-                    "success": True,
-                    "recommendations": enriched_recommendations,
-                    "total_flights_analyzed": len(flights)
-                }
+            recommendations, complete = self._parse_response(response)
+            
+            metrics.incr("llm.parse.total")
+            if not recommendations:
+                # Aucune recommandation exploitable : retourner les 5 meilleurs vols du classement
+                metrics.incr("llm.parse.failures")
+                print(f"Réponse IA inexploitable: {response}")
+                return self._fallback_recommendations(flights, airline)
+            if not complete:
+                metrics.incr("llm.parse.salvaged")
+            
+            # Enrichir les recommandations avec les données complètes des vols
+            flights_by_id = {f["id"]: f for f in flights}
+            enriched_recommendations = []
+            for rec in recommendations[:5]:
+                flight_data = flights_by_id.get(rec["flight_id"])
                 
-            except json.JSONDecodeError as e:
-                # Si le parsing JSON échoue, retourner les 5 meilleurs vols par prix
-                print(f"Erreur de parsing JSON: {e}")
-                print(f"Réponse brute: {response}")
-                return self._fallback_recommendations(flights)
+                if flight_data:
+                    enriched_recommendations.append({
+                        **flight_data,
+                        "ai_analysis": {
+                            "rank": rec["rank"],
+                            "reason": rec["reason"],
+                            "highlights": rec["highlights"]
+                        }
+                    })
+            
+            return {
+                "success": True,
+                "recommendations": enriched_recommendations,
+                "total_flights_analyzed": len(flights)
+            }
         
         except Exception as e:
             print(f"Erreur lors de l'analyse: {e}")
-            return self._fallback_recommendations(flights)
+            return self._fallback_recommendations(flights, airline)
+    
+    
+    def _build_messages(
+        self,
+        flights: List[Dict],
+        origin: str,
+        destination: str,
+        date: str,
+        airline: str
+    ) -> List:
+        """Assemble le préfixe statique et la partie propre à la recherche."""
+        
+        # JSON compact : moins de tokens non réutilisables dans la partie variable
+        flights_json = json.dumps(flights, ensure_ascii=False, separators=(",", ":"))
+        
+        return [
+            *self.static_prefix,
+            HumanMessage(content=USER_PROMPT.format(
+                origin=origin,
+                destination=destination,
+                date=date,
+                airline=airline if airline else "Aucune préférence",
+                flights_json=flights_json
+            ))
+        ]
+    
     
+    def _record_usage(self, response):
+        """Enregistre les tokens du prompt servis depuis le cache du fournisseur."""
+        
+        message = response["raw"] if isinstance(response, dict) else response
+        usage = getattr(message, "usage_metadata", None)
+        if not usage:
+            return
+        
+        prompt_tokens = usage.get("input_tokens", 0)
+        cached_tokens = usage.get("input_token_details", {}).get("cache_read", 0)
+        
+        metrics.incr("llm.prompt_tokens.total", prompt_tokens)
+        metrics.incr("llm.prompt_tokens.cached", cached_tokens)
+        print(f"Tokens du prompt: {cached_tokens} en cache, "
+              f"{prompt_tokens - cached_tokens} hors cache")
     
-    def _fallback_recommendations(self, flights: List[Dict]) -> Dict:
+    
+    def _parse_response(self, response):
         """
-        Recommandations de secours si l'analyse IA échoue.
-        Sélectionne simplement les 5 vols les moins chers avec vols directs prioritaires.
+        Extrait les recommandations de la réponse de la chaîne.
+        En mode structuré, utilise la sortie validée et, à défaut,
+        récupère les éléments valides des arguments ou du texte bruts.
+        
+        Returns:
+            Tuple (recommandations validées, réponse entièrement valide)
         """
         
-        # Trier par nombre d'escales puis par prix
-        sorted_flights = sorted(
-            flights,
-            key=lambda x: (x["stops"], x["price"])
-        )
+        if not isinstance(response, dict):
+            return parse_recommendations(response.content)
+        
+        if response.get("parsed") is not None:
+            return parse_recommendations(response["parsed"])
+        
+        raw = response["raw"]
+        if raw.tool_calls:
+            recommendations, _ = parse_recommendations(raw.tool_calls[0]["args"])
+            return recommendations, False
+        if raw.invalid_tool_calls:
+            recommendations, _ = parse_recommendations(raw.invalid_tool_calls[0]["args"])
+            return recommendations, False
+        
+        recommendations, _ = parse_recommendations(raw.content)
+        return recommendations, False
+    
+    
+    def _deterministic_recommendations(self, flights: List[Dict], airline: str = "") -> Dict:
+        """
+        Recommandations sans IA lorsque le classement est évident.
+        Les explications sont générées à partir des caractéristiques des vols.
+        """
+        
+        cheapest = min((f["price"] for f in flights), default=0)
+        shortest = min((duration_minutes(f) for f in flights), default=0)
+        
+        recommendations = []
+        for i, flight in enumerate(rank_flights(flights, airline)[:5]):
+            highlights = []
+            if is_preferred_airline(flight, airline):
+                highlights.append("Compagnie préférée")
+            if flight["stops"] == 0:
+                highlights.append("Vol direct")
+            if flight["price"] == cheapest:
+                highlights.append("Prix le plus bas")
+            elif flight["price"] < 300:
+                highlights.append("Prix très compétitif")
+            elif flight["price"] < 500:
+                highlights.append("Bon rapport qualité/prix")
+            if duration_minutes(flight) == shortest:
+                highlights.append("Durée la plus courte")
+            if flight["baggage"]["checked"]:
+                highlights.append(f"{flight['baggage']['checked']} bagage(s) en soute inclus")
+            
+            recommendations.append({
+                **flight,
+                "ai_analysis": {
+                    "rank": i + 1,
+                    "reason": (
+                        f"{flight['airline']} à {flight['price']} {flight['currency']}, "
+                        f"{flight['duration']} de vol. "
+                        f"Recommandé pour: {', '.join(highlights) if highlights else 'Bon choix général'}"
+                    ),
+                    "highlights": highlights
+                }
+            })
+        
+        return {
+            "success": True,
+            "recommendations": recommendations,
+            "total_flights_analyzed": len(flights),
+            "note": "Classement évident : recommandations calculées sans appel à l'IA"
+        }
+    
+    
+    def _fallback_recommendations(self, flights: List[Dict], airline: str = "") -> Dict:
+        """
+        Recommandations de secours si l'analyse IA échoue.
+        Sélectionne les 5 meilleurs vols du classement déterministe
+        (compagnie préférée, vols directs, puis prix).
+        """
         
-        top_5 = sorted_flights[:5]
+        top_5 = rank_flights(flights, airline)[:5]
         
         # Ajouter une analyse basique
         for i, flight in enumerate(top_5):
             reasons = []
+            if is_preferred_airline(flight, airline):
+                reasons.append("Compagnie préférée")
             if flight["stops"] == 0:
                 reasons.append("Vol direct")
             if flight["price"] < 300:
@@ -185,7 +358,7 @@ class FlightAnalyzerService:
             "success": True,
             "recommendations": top_5,
             "total_flights_analyzed": len(flights),
-            "note": "Recommandations basées sur le prix et les escales (mode de secours)"
+            "note": "Recommandations basées sur la compagnie, les escales et le prix (mode de secours)"
         }
 
 
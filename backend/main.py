@@ -5,13 +5,18 @@ Gère les connexions WebSocket et les recherches de vols en temps réel.
 
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import StreamingResponse
+from pydantic import BaseModel, Field
 import socketio
-from typing import Dict
+from typing import Dict, List, Optional
 import asyncio
+import json
 
 from config import settings
-from mock_data import generate_mock_flights, get_airport_code
-from flight_analyzer import flight_analyzer
+from price_watch import PriceWatchService
+from search_service import search_service
+from airport_index import airport_index
+from metrics import metrics
 
 
 # Créer l'application FastAPI
@@ -42,6 +47,9 @@ socket_app = socketio.ASGIApp(
     other_asgi_app=app
 )
 
+# Service de surveillance des prix partagé par route
+price_watch = PriceWatchService(sio)
+
 
 # ==================== Routes HTTP ====================
 
@@ -53,6 +61,9 @@ async def root():
         "version": "1.0.0",
         "endpoints": {
             "health": "/health",
+            "airports": "/airports/suggest?q=",
+            "metrics": "/metrics",
+            "batch_search": "POST /search/batch",
             "websocket": "Socket.IO connection available"
         }
     }
@@ -72,6 +83,65 @@ async def health_check():
     }
 
 
+@app.get("/metrics")
+async def get_metrics():
+    """Métriques du service (appels IA, taux d'échec du parsing...)."""
+    return {
+        **metrics.snapshot(),
+        "llm_parse_failure_rate": metrics.rate("llm.parse.failures", "llm.parse.total"),
+        "llm_prompt_cache_ratio": metrics.rate("llm.prompt_tokens.cached", "llm.prompt_tokens.total")
+    }
+
+
+@app.get("/airports/suggest")
+async def suggest_airports(q: str = "", limit: int = 8):
+    """
+    Autocomplétion des aéroports et des villes (code IATA, ville, nom).
+    
+    Args:
+        q: Texte saisi par l'utilisateur
+        limit: Nombre maximum de suggestions
+    """
+    return {
+        "query": q,
+        "results": airport_index.suggest(q, max(1, min(limit, 10)))
+    }
+
+
+class SearchSpec(BaseModel):
+    """Critères d'une recherche de vols."""
+    origin: str
+    destination: str
+    date: str
+    airline: str = ""
+
+
+class BatchSearchRequest(BaseModel):
+    """Lot de recherches à exécuter en parallèle."""
+    searches: List[SearchSpec] = Field(min_length=1, max_length=settings.batch_search_max_size)
+    concurrency: Optional[int] = Field(default=None, ge=1)
+
+
+@app.post("/search/batch")
+async def search_batch(request: BatchSearchRequest):
+    """
+    Exécute un lot de recherches avec une concurrence bornée.
+    Chaque résultat est envoyé en NDJSON (une ligne JSON par recherche)
+    dès qu'il est prêt ; le champ index indique la recherche correspondante.
+    """
+    concurrency = min(
+        request.concurrency or settings.batch_search_concurrency,
+        settings.batch_search_concurrency
+    )
+    specs = [spec.model_dump() for spec in request.searches]
+    
+    async def stream_results():
+        async for index, line in search_service.search_many(specs, concurrency):
+            yield json.dumps({"index": index, **line}, ensure_ascii=False) + "\n"
+    
+    return StreamingResponse(stream_results(), media_type="application/x-ndjson")
+
+
 # ==================== Socket.IO Events ====================
 
 @sio.event
@@ -99,6 +169,33 @@ async def disconnect(sid):
         sid: Session ID du client
     """
     print(f"Client déconnecté: {sid}")
+    await price_watch.unsubscribe_all(sid)
+
+
+@sio.event
+async def airport_suggest(sid, data: Dict):
+    """
+    Autocomplétion des aéroports en temps réel pendant la saisie.
+    
+    Args:
+        sid: Session ID du client
+        data: Dictionnaire contenant query et limit (optionnel)
+    """
+    
+    try:
+        query = data.get('query', '')
+        limit = int(data.get('limit', 8))
+        
+        await sio.emit('airport_suggestions', {
+            'query': query,
+            'results': airport_index.suggest(query, max(1, min(limit, 10)))
+        }, room=sid)
+        
+    except Exception as e:
+        print(f"Erreur lors de l'autocomplétion: {e}")
+        await sio.emit('airport_suggestions_error', {
+            'error': str(e)
+        }, room=sid)
 
 
 @sio.event
@@ -116,14 +213,18 @@ async def search_flights(sid, data: Dict):
     try:
         print(f"Recherche de vols reçue de {sid}: {data}")
         
-        # Extraire les paramètres de recherche
-        origin = data.get('origin', '')
-        destination = data.get('destination', '')
-        date = data.get('date', '')
-        airline = data.get('airline', '')
+        # Extraire les paramètres de recherche (villes normalisées en codes IATA)
+        search_params = search_service.normalize_params(
+            origin=data.get('origin', ''),
+            destination=data.get('destination', ''),
+            date=data.get('date', ''),
+            airline=data.get('airline', '')
+        )
+        origin = search_params['origin']
+        destination = search_params['destination']
         
         # Valider les données
-        if not origin or not destination or not date:
+        if not origin or not destination or not search_params['date']:
             await sio.emit('search_error', {
                 'error': 'Paramètres manquants',
                 'message': 'Veuillez fournir l\'origine, la destination et la date'
@@ -139,41 +240,24 @@ async def search_flights(sid, data: Dict):
         # Simuler un délai de recherche (pour l'effet temps réel)
         await asyncio.sleep(1)
         
-        # Étape 2: Générer les vols mock
-        flights = generate_mock_flights(
-            origin=origin,
-            destination=destination,
-            date=date,
-            airline=airline
-        )
-        
         await sio.emit('search_status', {
             'status': 'analyzing',
-            'message': f'{len(flights)} vols trouvés. Analyse en cours avec l\'IA...'
+            'message': 'Recherche des vols et analyse en cours avec l\'IA...'
         }, room=sid)
         
-        # Simuler un délai d'analyse
-        await asyncio.sleep(1.5)
-        
-        # Étape 3: Analyser avec LangChain/OpenAI
-        analysis_result = flight_analyzer.analyze_flights(
-            flights=flights,
-            origin=origin,
-            destination=destination,
-            date=date,
-            airline=airline
+        # Étapes 2 et 3: Générer les vols et les analyser avec LangChain/OpenAI
+        # (pipeline partagé avec les recherches identiques et mis en cache).
+        # Le délai d'analyse simulé est propre à ce client et court en parallèle.
+        result, _ = await asyncio.gather(
+            search_service.search(**search_params),
+            asyncio.sleep(1.5)
         )
         
         # Étape 4: Envoyer les résultats
         await sio.emit('search_complete', {
             'status': 'completed',
-            'data': analysis_result,
-            'search_params': {
-                'origin': origin,
-                'destination': destination,
-                'date': date,
-                'airline': airline
-            }
+            'data': result['data'],
+            'search_params': result['search_params']
         }, room=sid)
         
         print(f"Recherche complétée pour {sid}")
@@ -220,6 +304,64 @@ async def get_flight_details(sid, data: Dict):
         }, room=sid)
 
 
+@sio.event
+async def watch_route(sid, data: Dict):
+    """
+    Abonne le client aux mises à jour de prix d'une route.
+    Tous les clients d'une même route partagent une room et un seul
+    rafraîchissement : le client reçoit l'instantané complet puis
+    uniquement les différences via 'price_watch_update'.
+    
+    Args:
+        sid: Session ID du client
+        data: Dictionnaire contenant origin, destination, date, airline
+    """
+    
+    try:
+        search_params = search_service.normalize_params(
+            origin=data.get('origin', ''),
+            destination=data.get('destination', ''),
+            date=data.get('date', ''),
+            airline=data.get('airline', '')
+        )
+        
+        if not search_params['origin'] or not search_params['destination'] or not search_params['date']:
+            await sio.emit('price_watch_error', {
+                'error': 'Paramètres manquants',
+                'message': 'Veuillez fournir l\'origine, la destination et la date'
+            }, room=sid)
+            return
+        
+        snapshot = await price_watch.subscribe(sid, search_params)
+        if snapshot is None:
+            return
+        
+        await sio.emit('price_watch_snapshot', snapshot, room=sid)
+        print(f"{sid} surveille {snapshot['route']}")
+        
+    except Exception as e:
+        print(f"Erreur lors de l'abonnement: {e}")
+        await sio.emit('price_watch_error', {
+            'error': 'Erreur serveur',
+            'message': str(e)
+        }, room=sid)
+
+
+@sio.event
+async def unwatch_route(sid, data: Dict):
+    """
+    Désabonne le client d'une route surveillée.
+    
+    Args:
+        sid: Session ID du client
+        data: Dictionnaire contenant route (nom reçu dans le snapshot)
+    """
+    
+    route = data.get('route')
+    if route:
+        await price_watch.unsubscribe(sid, route)
+
+
 # ==================== Lancement de l'application ====================
 
 if __name__ == "__main__":
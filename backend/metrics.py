@@ -0,0 +1,74 @@
+"""
+Métriques applicatives en mémoire (compteurs et latences).
+Exposées par l'endpoint /metrics pour suivre le comportement du service.
+"""
+
+from typing import Dict
+import threading
+
+
+class MetricsRegistry:
+    """
+    Registre thread-safe de compteurs et de latences.
+    Les analyses IA tournant dans des threads, chaque accès est protégé par un verrou.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._counters: Dict[str, int] = {}
+        self._timings: Dict[str, Dict[str, float]] = {}
+
+
+    def incr(self, name: str, value: int = 1):
+        """Incrémente un compteur."""
+        with self._lock:
+            self._counters[name] = self._counters.get(name, 0) + value
+
+
+    def observe(self, name: str, seconds: float):
+        """Enregistre une durée (en secondes) pour une opération."""
+        with self._lock:
+            timing = self._timings.setdefault(name, {"count": 0, "total": 0.0, "max": 0.0})
+            timing["count"] += 1
+            timing["total"] += seconds
+            timing["max"] = max(timing["max"], seconds)
+
+
+    def count(self, name: str) -> int:
+        """Retourne la valeur courante d'un compteur."""
+        with self._lock:
+            return self._counters.get(name, 0)
+
+
+    def rate(self, numerator: str, denominator: str) -> float:
+        """Retourne le rapport entre deux compteurs (0 si le dénominateur est nul)."""
+        with self._lock:
+            total = self._counters.get(denominator, 0)
+            return self._counters.get(numerator, 0) / total if total else 0.0
+
+
+    def snapshot(self) -> Dict:
+        """Retourne une copie sérialisable de toutes les métriques."""
+        with self._lock:
+            return {
+                "counters": dict(self._counters),
+                "timings": {
+                    name: {
+                        "count": t["count"],
+                        "avg_ms": round(t["total"] / t["count"] * 1000, 2),
+                        "max_ms": round(t["max"] * 1000, 2)
+                    }
+                    for name, t in self._timings.items()
+                }
+            }
+
+
+    def reset(self):
+        """Remet toutes les métriques à zéro."""
+        with self._lock:
+            self._counters.clear()
+            self._timings.clear()
+
+
+# Instance globale des métriques
+metrics = MetricsRegistry()
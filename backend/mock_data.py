@@ -7,6 +7,8 @@ from typing import List, Dict
 import random
 from datetime import datetime, timedelta
 
+from airport_index import airport_index
+
 
 def generate_mock_flights(
     origin: str,
@@ -176,5 +178,72 @@ POPULAR_DESTINATIONS = {
 
 
 def get_airport_code(city_name: str) -> str:
-    """Convertit un nom de ville en code IATA d'aéroport."""
-    return POPULAR_DESTINATIONS.get(city_name, city_name.upper()[:3])
+    """
+    Convertit un nom de ville en code IATA d'aéroport via l'index des aéroports.
+    Retourne la saisie nettoyée si la ville est inconnue.
+    """
+    return airport_index.canonicalize(city_name)
+
+
+def refresh_mock_flights(
+    flights: List[Dict],
+    airline: str = None,
+    next_id: int = None
+) -> List[Dict]:
+    """
+    Fait évoluer une liste de vols mock pour simuler un marché vivant.
+    Les prix et les sièges varient légèrement, certains vols complets
+    disparaissent et de nouveaux vols peuvent apparaître.
+    
+    Args:
+        flights: Dernière liste de vols connue pour la route
+        airline: Compagnie préférée de la route (optionnel)
+        next_id: Numéro du prochain vol ajouté ; à suivre par route pour ne
+            jamais réutiliser l'ID d'un vol retiré (par défaut: plus grand ID + 1)
+    
+    Returns:
+        Nouvelle liste de vols (les dictionnaires d'origine ne sont pas modifiés)
+    """
+    
+    refreshed = []
+    
+    for flight in flights:
+        # Environ 30% des vols changent de prix à chaque rafraîchissement
+        price = flight["price"]
+        if random.random() < 0.3:
+            price = max(50, int(price * random.uniform(0.92, 1.08)))
+        
+        # Les sièges se vendent progressivement
+        available_seats = flight["available_seats"]
+        if random.random() < 0.4:
+            available_seats = max(0, available_seats - random.randint(1, 5))
+        
+        # Un vol complet n'est plus proposé
+        if available_seats == 0:
+            continue
+        
+        refreshed.append({
+            **flight,
+            "price": price,
+            "available_seats": available_seats
+        })
+    
+    # Occasionnellement, une nouvelle offre apparaît sur la route
+    if flights and random.random() < 0.2:
+        template = flights[0]
+        new_flight = generate_mock_flights(
+            origin=template["origin"],
+            destination=template["destination"],
+            date=template["departure_time"][:10],
+            airline=airline
+        )[0]
+        if next_id is None:
+            next_id = max(int(f["id"][2:]) for f in flights) + 1
+        new_flight["id"] = f"FL{next_id}"
+        new_flight["booking_url"] = f"https://booking.example.com/flight/{next_id}"
+        refreshed.append(new_flight)
+    
+    # Trier par prix
+    refreshed.sort(key=lambda x: x["price"])
+    
+    return refreshed
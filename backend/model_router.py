@@ -0,0 +1,121 @@
+"""
+Routage des analyses vers le niveau de modèle adapté.
+Mesure la confiance du classement déterministe : un classement évident est
+servi sans IA, un cas intermédiaire par un modèle rapide et économique,
+et seuls les cas ambigus par le modèle complet.
+"""
+
+from typing import Dict, List, Tuple
+import re
+
+from config import settings
+
+
+TIER_DETERMINISTIC = "deterministic"
+TIER_FAST = "fast"
+TIER_FULL = "full"
+
+TIERS = (TIER_DETERMINISTIC, TIER_FAST, TIER_FULL)
+
+
+def is_preferred_airline(flight: Dict, airline: str = "") -> bool:
+    """Indique si le vol est opéré par la compagnie préférée (si elle est définie)."""
+    return bool(airline) and flight.get("airline", "").strip().lower() == airline.strip().lower()
+
+
+def rank_flights(flights: List[Dict], airline: str = "") -> List[Dict]:
+    """
+    Classement déterministe : vols de la compagnie préférée d'abord,
+    puis vols directs, puis par prix.
+    """
+    return sorted(
+        flights,
+        key=lambda x: (not is_preferred_airline(x, airline), x["stops"], x["price"])
+    )
+
+
+def duration_minutes(flight: Dict) -> int:
+    """Convertit la durée d'un vol ("7h 30m") en minutes."""
+    match = re.match(r"\s*(\d+)h\s*(\d+)m", flight.get("duration", ""))
+    if not match:
+        return 0
+    return int(match.group(1)) * 60 + int(match.group(2))
+
+
+def _dominates(a: Dict, b: Dict, airline: str = "") -> bool:
+    """
+    Indique si le vol a est au moins aussi bon que b sur la compagnie préférée,
+    le prix, les escales et la durée.
+    """
+    return (
+        is_preferred_airline(a, airline) >= is_preferred_airline(b, airline)
+        and a["price"] <= b["price"]
+        and a["stops"] <= b["stops"]
+        and duration_minutes(a) <= duration_minutes(b)
+    )
+
+
+def ranking_confidence(flights: List[Dict], k: int = 5, airline: str = "") -> float:
+    """
+    Mesure la confiance du classement déterministe des K meilleurs vols.
+    La confiance est la part des autres vols dominés (moins chers, moins
+    d'escales et plus courts à la fois, sans perdre la compagnie préférée)
+    par au moins un vol du top K.
+
+    Returns:
+        Valeur entre 0 (classement ambigu) et 1 (top K clairement dominant)
+    """
+    ranked = rank_flights(flights, airline)
+    top, rest = ranked[:k], ranked[k:]
+    if not rest:
+        # Tous les vols sont recommandés : aucun arbitrage à faire
+        return 1.0
+
+    dominated = sum(1 for b in rest if any(_dominates(a, b, airline) for a in top))
+    return dominated / len(rest)
+
+
+class ModelRouter:
+    """Choisit le niveau de modèle à partir de la confiance du classement."""
+
+    def __init__(
+        self,
+        deterministic_threshold: float = None,
+        fast_threshold: float = None,
+        k: int = 5
+    ):
+        """
+        Args:
+            deterministic_threshold: Confiance à partir de laquelle l'IA n'est pas appelée
+            fast_threshold: Confiance à partir de laquelle le modèle rapide suffit
+            k: Nombre de vols recommandés
+        """
+        self.deterministic_threshold = (
+            deterministic_threshold if deterministic_threshold is not None
+            else settings.router_deterministic_threshold
+        )
+        self.fast_threshold = (
+            fast_threshold if fast_threshold is not None
+            else settings.router_fast_threshold
+        )
+        self.k = k
+
+
+    def route(self, flights: List[Dict], airline: str = "") -> Tuple[str, float]:
+        """
+        Détermine le niveau de traitement d'une liste de vols.
+
+        Args:
+            flights: Liste des vols disponibles
+            airline: Compagnie préférée (optionnel)
+
+        Returns:
+            Tuple (niveau, confiance du classement)
+        """
+        confidence = ranking_confidence(flights, self.k, airline)
+
+        if confidence >= self.deterministic_threshold:
+            return TIER_DETERMINISTIC, confidence
+        if confidence >= self.fast_threshold:
+            return TIER_FAST, confidence
+        return TIER_FULL, confidence
@@ -0,0 +1,268 @@
+"""
+Service de surveillance des prix en temps réel.
+Les clients qui surveillent la même route partagent une room Socket.IO :
+un seul rafraîchissement est effectué par route, et seules les différences
+avec le dernier instantané de la room sont envoyées.
+"""
+
+from typing import Dict, List, Optional, Set
+import asyncio
+
+from config import settings
+from mock_data import refresh_mock_flights
+from flight_analyzer import flight_analyzer
+from search_service import search_service
+from model_router import rank_flights
+
+
+# Champs d'un vol dont les variations sont poussées aux clients
+WATCHED_FIELDS = ("price", "available_seats")
+
+
+def compute_flight_delta(previous: List[Dict], current: List[Dict]) -> Dict:
+    """
+    Calcule les différences entre deux listes de vols.
+
+    Args:
+        previous: Dernier instantané connu
+        current: Nouvelle liste de vols
+
+    Returns:
+        Dictionnaire contenant les vols modifiés (seulement les champs changés),
+        les vols ajoutés (complets) et les IDs des vols retirés
+    """
+
+    previous_by_id = {f["id"]: f for f in previous}
+    current_ids = set()
+    changed = []
+    added = []
+
+    for flight in current:
+        current_ids.add(flight["id"])
+        old = previous_by_id.get(flight["id"])
+
+        if old is None:
+            added.append(flight)
+            continue
+
+        changes = {
+            field: flight[field]
+            for field in WATCHED_FIELDS
+            if flight.get(field) != old.get(field)
+        }
+        if changes:
+            changed.append({"id": flight["id"], **changes})
+
+    removed = [f["id"] for f in previous if f["id"] not in current_ids]
+
+    return {
+        "changed": changed,
+        "added": added,
+        "removed": removed
+    }
+
+
+def top_flight_ids(flights: List[Dict], k: int, airline: str = "") -> Set[str]:
+    """Retourne l'ensemble des K meilleurs vols (compagnie préférée, escales puis prix)."""
+    return {f["id"] for f in rank_flights(flights, airline)[:k]}
+
+
+class PriceWatchService:
+    """
+    Gère les abonnements aux routes et le rafraîchissement partagé des prix.
+    Chaque route dispose d'une room Socket.IO, d'un instantané et d'une
+    tâche de rafraîchissement qui s'arrête quand plus personne ne la surveille.
+    """
+
+    def __init__(self, sio, interval: float = None, top_k: int = None):
+        """
+        Args:
+            sio: Serveur Socket.IO utilisé pour les rooms et l'envoi des mises à jour
+            interval: Délai en secondes entre deux rafraîchissements d'une route
+            top_k: Nombre de vols dont le changement déclenche une nouvelle analyse IA
+        """
+        self.sio = sio
+        self.interval = interval if interval is not None else settings.price_watch_interval
+        self.top_k = top_k if top_k is not None else settings.price_watch_top_k
+
+        self.subscribers: Dict[str, Set[str]] = {}
+        self.snapshots: Dict[str, Dict] = {}
+        self.tasks: Dict[str, asyncio.Task] = {}
+        self._locks: Dict[str, asyncio.Lock] = {}
+
+
+    @staticmethod
+    def route_room(origin: str, destination: str, date: str, airline: str = "") -> str:
+        """Construit le nom de la room partagée par tous les clients d'une route."""
+        parts = [origin, destination, date, airline or ""]
+        return "watch:" + ":".join(p.strip().lower() for p in parts)
+
+
+    async def subscribe(self, sid: str, params: Dict) -> Optional[Dict]:
+        """
+        Ajoute un client à la room de la route et retourne l'instantané courant.
+
+        Args:
+            sid: Session ID du client
+            params: Dictionnaire contenant origin, destination, date, airline
+
+        Returns:
+            L'instantané courant de la route, ou None si le client
+            s'est désabonné entre-temps
+        """
+        room = self.route_room(
+            params["origin"],
+            params["destination"],
+            params["date"],
+            params.get("airline", "")
+        )
+
+        await self.sio.enter_room(sid, room)
+        self.subscribers.setdefault(room, set()).add(sid)
+
+        lock = self._locks.setdefault(room, asyncio.Lock())
+        async with lock:
+            snapshot = self.snapshots.get(room)
+            if snapshot is None:
+                snapshot = await self._build_snapshot(params)
+
+        # Le client a pu se désabonner pendant la génération de l'instantané
+        if sid not in self.subscribers.get(room, set()):
+            return None
+
+        self.snapshots.setdefault(room, snapshot)
+        if room not in self.tasks:
+            self.tasks[room] = asyncio.create_task(self._refresh_loop(room))
+
+        snapshot = self.snapshots[room]
+        return {
+            "route": room,
+            "version": snapshot["version"],
+            "search_params": snapshot["search_params"],
+            "flights": snapshot["flights"],
+            "analysis": snapshot["analysis"]
+        }
+
+
+    async def unsubscribe(self, sid: str, room: str):
+        """Retire un client de la room d'une route."""
+        await self.sio.leave_room(sid, room)
+
+        sids = self.subscribers.get(room)
+        if sids is not None:
+            sids.discard(sid)
+            if not sids:
+                self._stop_route(room)
+
+
+    async def unsubscribe_all(self, sid: str):
+        """Retire un client de toutes les routes qu'il surveille (déconnexion)."""
+        for room in [r for r, sids in self.subscribers.items() if sid in sids]:
+            await self.unsubscribe(sid, room)
+
+
+    async def refresh_route(self, room: str) -> Optional[Dict]:
+        """
+        Recalcule les offres d'une route et pousse les différences à la room.
+        L'analyse IA n'est relancée que si l'ensemble des K meilleurs vols change
+        ou si un vol recommandé par la dernière analyse n'est plus proposé.
+
+        Returns:
+            La mise à jour envoyée, ou None si rien n'a changé
+        """
+        snapshot = self.snapshots.get(room)
+        if snapshot is None:
+            return None
+
+        flights = refresh_mock_flights(
+            snapshot["flights"],
+            airline=snapshot["search_params"]["airline"],
+            next_id=snapshot["next_id"]
+        )
+        delta = compute_flight_delta(snapshot["flights"], flights)
+
+        # Relancer l'analyse si le top K change ou si un vol recommandé a disparu
+        recommended_ids = {
+            rec["id"] for rec in (snapshot["analysis"] or {}).get("recommendations", [])
+        }
+        analysis = None
+        top_ids = top_flight_ids(flights, self.top_k, snapshot["search_params"]["airline"])
+        if top_ids != snapshot["top_ids"] or recommended_ids & set(delta["removed"]):
+            analysis = await self._analyze(flights, snapshot["search_params"])
+
+        if not (delta["changed"] or delta["added"] or delta["removed"] or analysis):
+            return None
+
+        snapshot["flights"] = flights
+        snapshot["top_ids"] = top_ids
+        snapshot["next_id"] += len(delta["added"])
+        snapshot["version"] += 1
+        if analysis is not None:
+            snapshot["analysis"] = analysis
+
+        update = {
+            "route": room,
+            "version": snapshot["version"],
+            **delta
+        }
+        if analysis is not None:
+            update["analysis"] = analysis
+
+        await self.sio.emit('price_watch_update', update, room=room)
+        return update
+
+
+    async def _build_snapshot(self, params: Dict) -> Dict:
+        """Récupère les offres initiales d'une route et leur analyse."""
+        result = await search_service.search(
+            origin=params["origin"],
+            destination=params["destination"],
+            date=params["date"],
+            airline=params.get("airline", "")
+        )
+
+        return {
+            "version": 0,
+            "search_params": result["search_params"],
+            "flights": result["flights"],
+            # Compteur d'IDs propre à la route : un vol retiré n'est jamais réutilisé
+            "next_id": max((int(f["id"][2:]) for f in result["flights"]), default=999) + 1,
+            "top_ids": top_flight_ids(
+                result["flights"], self.top_k, result["search_params"]["airline"]
+            ),
+            "analysis": result["data"]
+        }
+
+
+    async def _analyze(self, flights: List[Dict], search_params: Dict) -> Dict:
+        """Lance l'analyse IA sans bloquer la boucle d'événements."""
+        # Copier les vols : l'analyse enrichit les dictionnaires recommandés
+        return await asyncio.to_thread(
+            flight_analyzer.analyze_flights,
+            flights=[dict(f) for f in flights],
+            **search_params
+        )
+
+
+    async def _refresh_loop(self, room: str):
+        """Rafraîchit une route tant qu'au moins un client la surveille."""
+        try:
+            while self.subscribers.get(room):
+                await asyncio.sleep(self.interval)
+                try:
+                    await self.refresh_route(room)
+                except Exception as e:
+                    print(f"Erreur lors du rafraîchissement de {room}: {e}")
+        except asyncio.CancelledError:
+            pass
+
+
+    def _stop_route(self, room: str):
+        """Libère les ressources d'une route qui n'a plus d'abonnés."""
+        task = self.tasks.pop(room, None)
+        if task is not None:
+            task.cancel()
+
+        self.subscribers.pop(room, None)
+        self.snapshots.pop(room, None)
+        self._locks.pop(room, None)
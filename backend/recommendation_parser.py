@@ -0,0 +1,123 @@
+"""
+Schéma des recommandations produites par le LLM et parseur tolérant.
+Le parseur récupère les recommandations valides même lorsque la réponse
+est partiellement malformée (JSON tronqué, élément invalide, texte autour).
+"""
+
+from typing import Dict, List, Optional, Tuple
+from pydantic import BaseModel, Field, ValidationError
+import json
+import re
+
+
+class FlightRecommendation(BaseModel):
+    """Une recommandation de vol produite par le LLM."""
+
+    flight_id: str = Field(description="Identifiant du vol recommandé, ex: FL1001")
+    rank: int = Field(description="Rang de la recommandation, 1 étant la meilleure")
+    reason: str = Field(description="Explication courte et claire (2-3 phrases)")
+    highlights: List[str] = Field(default_factory=list, description="Points forts du vol")
+
+
+class RecommendationList(BaseModel):
+    """Les meilleures offres de vols recommandées, par ordre de préférence."""
+
+    recommendations: List[FlightRecommendation]
+
+
+# Début probable d'une recommandation dans un texte JSON
+_ITEM_START = re.compile(r'\{\s*"flight_id"')
+
+# Contenu d'un bloc de code markdown (```json ... ``` ou ``` ... ```)
+_FENCE = re.compile(r"```(?:json)?(.*?)(?:```|$)", re.DOTALL)
+
+_decoder = json.JSONDecoder()
+
+
+def parse_recommendations(payload) -> Tuple[List[Dict], bool]:
+    """
+    Extrait les recommandations valides d'une réponse du LLM.
+
+    Args:
+        payload: Texte brut, dictionnaire déjà décodé ou RecommendationList
+
+    Returns:
+        Tuple (recommandations validées, réponse entièrement valide)
+    """
+
+    if isinstance(payload, RecommendationList):
+        return [rec.model_dump() for rec in payload.recommendations], True
+
+    if isinstance(payload, dict):
+        items = payload.get("recommendations")
+        if not isinstance(items, list):
+            return [], False
+        valid = _validate_items(items)
+        return valid, len(valid) == len(items)
+
+    text = _strip_fences(payload or "")
+
+    # Cas nominal : la réponse complète est un JSON valide
+    try:
+        document = json.loads(text)
+    except json.JSONDecodeError:
+        document = None
+    if isinstance(document, dict):
+        return parse_recommendations(document)
+
+    # Sinon, récupérer élément par élément ce qui peut l'être,
+    # dans la réponse complète si le bloc extrait ne contient rien
+    items = _salvage_items(text) or _salvage_items(payload or "")
+    return _validate_items(items), False
+
+
+def _strip_fences(text: str) -> str:
+    """
+    Retire les blocs de code markdown autour du JSON.
+    Le contenu du premier bloc est retenu, même précédé de texte,
+    et un bloc non refermé (réponse tronquée) est lu jusqu'à la fin.
+    """
+    match = _FENCE.search(text)
+    return (match.group(1) if match else text).strip()
+
+
+def _salvage_items(text: str) -> List[Dict]:
+    """
+    Décode un à un les objets qui ressemblent à des recommandations.
+    Un objet malformé est ignoré et la lecture reprend au suivant.
+    """
+    items = []
+    match = _ITEM_START.search(text)
+
+    while match is not None:
+        try:
+            item, end = _decoder.raw_decode(text, match.start())
+        except json.JSONDecodeError:
+            end = match.start() + 1
+        else:
+            if isinstance(item, dict):
+                items.append(item)
+
+        match = _ITEM_START.search(text, end)
+
+    return items
+
+
+def _validate_items(items: List) -> List[Dict]:
+    """Ne conserve que les éléments conformes au schéma FlightRecommendation."""
+    valid = []
+    for item in items:
+        recommendation = _validate_item(item)
+        if recommendation is not None:
+            valid.append(recommendation)
+    return valid
+
+
+def _validate_item(item) -> Optional[Dict]:
+    """Valide un élément, ou retourne None s'il n'est pas exploitable."""
+    if not isinstance(item, dict):
+        return None
+    try:
+        return FlightRecommendation.model_validate(item).model_dump()
+    except ValidationError:
+        return None
@@ -0,0 +1,185 @@
+"""
+Pipeline de recherche de vols partagé par Socket.IO et l'API REST.
+Normalise les paramètres, génère les offres, les analyse avec l'IA
+et met en cache les résultats par route pour éviter les recalculs.
+"""
+
+from typing import AsyncIterator, Dict, List, Tuple
+import asyncio
+import time
+
+from config import settings
+from mock_data import generate_mock_flights
+from flight_analyzer import flight_analyzer
+from airport_index import airport_index
+from metrics import metrics
+
+
+class SearchService:
+    """
+    Exécute les recherches de vols avec un cache à durée de vie limitée.
+    Les recherches identiques lancées en même temps ne sont calculées qu'une fois.
+    """
+
+    def __init__(self, cache_ttl: float = None):
+        """
+        Args:
+            cache_ttl: Durée de validité (en secondes) d'un résultat en cache
+        """
+        self.cache_ttl = cache_ttl if cache_ttl is not None else settings.search_cache_ttl
+
+        self._cache: Dict[Tuple, Tuple[float, Dict]] = {}
+        self._inflight: Dict[Tuple, asyncio.Task] = {}
+
+
+    @staticmethod
+    def normalize_params(
+        origin: str,
+        destination: str,
+        date: str,
+        airline: str = ""
+    ) -> Dict:
+        """Normalise les paramètres de recherche (villes en codes IATA)."""
+        return {
+            "origin": airport_index.canonicalize(origin or ""),
+            "destination": airport_index.canonicalize(destination or ""),
+            "date": (date or "").strip(),
+            "airline": (airline or "").strip()
+        }
+
+
+    async def search(
+        self,
+        origin: str,
+        destination: str,
+        date: str,
+        airline: str = ""
+    ) -> Dict:
+        """
+        Recherche et analyse les vols d'une route.
+
+        Args:
+            origin: Ville ou code d'origine
+            destination: Ville ou code de destination
+            date: Date du voyage (format: YYYY-MM-DD)
+            airline: Compagnie préférée (optionnel)
+
+        Returns:
+            Dictionnaire contenant search_params, flights et data (l'analyse IA)
+        """
+        search_params = self.normalize_params(origin, destination, date, airline)
+        if not search_params["origin"] or not search_params["destination"] or not search_params["date"]:
+            raise ValueError("Veuillez fournir l'origine, la destination et la date")
+
+        key = self._cache_key(search_params)
+
+        cached = self._cache.get(key)
+        if cached is not None and time.monotonic() - cached[0] < self.cache_ttl:
+            metrics.incr("search.cache_hits")
+            return cached[1]
+
+        # Une recherche identique est déjà en cours : partager son résultat
+        task = self._inflight.get(key)
+        if task is not None:
+            metrics.incr("search.inflight_joins")
+        else:
+            metrics.incr("search.cache_misses")
+            task = asyncio.create_task(self._run_pipeline(search_params))
+            task.add_done_callback(lambda t: self._on_pipeline_done(key, t))
+            self._inflight[key] = task
+
+        # shield : l'annulation d'un appelant n'interrompt pas la recherche partagée
+        return await asyncio.shield(task)
+
+
+    async def search_many(
+        self,
+        specs: List[Dict],
+        concurrency: int
+    ) -> AsyncIterator[Tuple[int, Dict]]:
+        """
+        Exécute plusieurs recherches avec une concurrence bornée et produit
+        chaque résultat dès qu'il est disponible (pas dans l'ordre d'envoi).
+
+        Args:
+            specs: Liste de dictionnaires contenant origin, destination, date, airline
+            concurrency: Nombre maximum de recherches simultanées
+
+        Yields:
+            Tuple (index de la recherche dans specs, ligne de résultat)
+        """
+        semaphore = asyncio.Semaphore(max(1, concurrency))
+
+        async def run(index: int, spec: Dict) -> Tuple[int, Dict]:
+            async with semaphore:
+                try:
+                    result = await self.search(
+                        origin=spec.get("origin", ""),
+                        destination=spec.get("destination", ""),
+                        date=spec.get("date", ""),
+                        airline=spec.get("airline", "")
+                    )
+                except Exception as e:
+                    return index, {"status": "error", "error": str(e)}
+
+                return index, {
+                    "status": "completed",
+                    "search_params": result["search_params"],
+                    "data": result["data"]
+                }
+
+        tasks = [asyncio.create_task(run(i, spec)) for i, spec in enumerate(specs)]
+        try:
+            for next_done in asyncio.as_completed(tasks):
+                yield await next_done
+        finally:
+            # Le client s'est déconnecté : abandonner les recherches restantes
+            for task in tasks:
+                task.cancel()
+
+
+    async def _run_pipeline(self, search_params: Dict) -> Dict:
+        """Génère les vols puis les analyse sans bloquer la boucle d'événements."""
+        flights = generate_mock_flights(**search_params)
+
+        # Copier les vols : l'analyse enrichit les dictionnaires recommandés
+        analysis = await asyncio.to_thread(
+            flight_analyzer.analyze_flights,
+            flights=[dict(f) for f in flights],
+            **search_params
+        )
+
+        return {
+            "search_params": search_params,
+            "flights": flights,
+            "data": analysis
+        }
+
+
+    def _on_pipeline_done(self, key: Tuple, task: asyncio.Task):
+        """Libère la recherche en cours et met son résultat en cache."""
+        self._inflight.pop(key, None)
+        if not task.cancelled() and task.exception() is None:
+            self._store(key, task.result())
+
+
+    def _store(self, key: Tuple, result: Dict):
+        """Met un résultat en cache et purge les entrées expirées."""
+        now = time.monotonic()
+        if len(self._cache) >= settings.search_cache_size:
+            self._cache = {
+                k: entry for k, entry in self._cache.items()
+                if now - entry[0] < self.cache_ttl
+            }
+        if len(self._cache) < settings.search_cache_size:
+            self._cache[key] = (now, result)
+
+
+    @staticmethod
+    def _cache_key(search_params: Dict) -> Tuple:
+        """Clé de cache insensible à la casse."""
+        return tuple(search_params[k].lower() for k in ("origin", "destination", "date", "airline"))
+
+
+# Instance globale du service
+search_service = SearchService()
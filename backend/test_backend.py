@@ -3,7 +3,16 @@ Script de test simple pour vérifier le fonctionnement du backend.
 Lance quelques requêtes de test pour valider la configuration.
 """
 
-from mock_data import generate_mock_flights, POPULAR_DESTINATIONS
+from mock_data import generate_mock_flights, refresh_mock_flights, POPULAR_DESTINATIONS
+from price_watch import compute_flight_delta, PriceWatchService
+import price_watch
+from airport_index import airport_index
+from recommendation_parser import parse_recommendations
+from model_router import ModelRouter, TIER_DETERMINISTIC, TIER_FULL, rank_flights
+from search_service import SearchService
+from metrics import metrics
+from langchain_core.messages import AIMessage
+import asyncio
 from flight_analyzer import flight_analyzer
 from config import settings
 
@@ -93,6 +102,383 @@ def test_configuration():
     print("Exemples:", ", ".join(list(POPULAR_DESTINATIONS.keys())[:5]))
 
 
+def test_price_watch():
+    """Teste le calcul des différences de la surveillance des prix."""
+    print("\n" + "="*60)
+    print("TEST 4: Surveillance des prix (deltas)")
+    print("="*60)
+    
+    flights = generate_mock_flights(
+        origin="Paris",
+        destination="London",
+        date="2025-12-25"
+    )
+    refreshed = refresh_mock_flights(flights)
+    delta = compute_flight_delta(flights, refreshed)
+    
+    # Rejouer le delta sur l'ancien instantané doit redonner la nouvelle liste
+    replayed = {f["id"]: dict(f) for f in flights}
+    for flight_id in delta["removed"]:
+        del replayed[flight_id]
+    for change in delta["changed"]:
+        replayed[change["id"]].update(change)
+    for flight in delta["added"]:
+        replayed[flight["id"]] = flight
+    
+    assert replayed == {f["id"]: f for f in refreshed}
+    assert compute_flight_delta(refreshed, refreshed) == {
+        "changed": [], "added": [], "removed": []
+    }
+    
+    print(f"✅ {len(delta['changed'])} vols modifiés, "
+          f"{len(delta['added'])} ajoutés, {len(delta['removed'])} retirés")
+
+
+def test_airport_index():
+    """Teste l'autocomplétion et la résolution des aéroports."""
+    print("\n" + "="*60)
+    print("TEST 5: Index des aéroports")
+    print("="*60)
+    
+    # Toutes les destinations populaires doivent être résolues
+    for city, code in POPULAR_DESTINATIONS.items():
+        assert airport_index.canonicalize(city) == code, city
+    
+    # Accents, casse et alias français
+    assert airport_index.canonicalize("zurich") == "ZRH"
+    assert airport_index.canonicalize("Genève") == "GVA"
+    assert airport_index.canonicalize("Londres") == "LHR"
+    assert airport_index.canonicalize("XYZ") == "XYZ"
+    
+    # Une ville hors index n'est jamais remplacée par une ville proche
+    for city in ("Turin", "Bergen", "Luxor"):
+        assert airport_index.canonicalize(f" {city} ") == city
+    
+    suggestions = [a["iata"] for a in airport_index.suggest("lon")]
+    assert suggestions[:2] == ["LHR", "LGW"]
+    
+    # Recherche approximative : ignorée pour les saisies courtes, mise en cache sinon
+    assert airport_index.suggest("zqx") == []
+    typo = airport_index.suggest("Pariss")
+    assert [a["iata"] for a in typo] == ["CDG"]
+    assert airport_index.suggest("Pariss") is typo
+    assert [a["iata"] for a in airport_index.suggest("Nwe York")][:1] == ["JFK"]
+    
+    print(f"✅ {len(airport_index.airports)} aéroports indexés")
+    print(f"   'par' -> {[a['iata'] for a in airport_index.suggest('par')]}")
+
+
+def test_recommendation_parser():
+    """Teste la récupération des recommandations d'une réponse malformée."""
+    print("\n" + "="*60)
+    print("TEST 6: Parseur tolérant des réponses IA")
+    print("="*60)
+    
+    valid = '{"recommendations": [{"flight_id": "FL1001", "rank": 1, "reason": "Direct"}]}'
+    recommendations, complete = parse_recommendations(f"```json\n{valid}\n```")
+    assert complete and recommendations[0]["flight_id"] == "FL1001"
+    
+    # Texte avant un bloc de code sans langage
+    recommendations, complete = parse_recommendations(f"Voici:\n```\n{valid}\n```")
+    assert complete and recommendations[0]["flight_id"] == "FL1001"
+    
+    # Réponse tronquée avec un élément invalide au milieu
+    truncated = (
+        '{"recommendations": ['
+        '{"flight_id": "FL1001", "rank": 1, "reason": "Direct"},'
+        '{"flight_id": "FL1002", rank: 2},'
+        '{"flight_id": "FL1003", "rank": 3, "reason": "Pas cher"},'
+        '{"flight_id": "FL1004", "rank": 4, "rea'
+    )
+    recommendations, complete = parse_recommendations(truncated)
+    assert not complete
+    assert [r["flight_id"] for r in recommendations] == ["FL1001", "FL1003"]
+    
+    print(f"✅ {len(recommendations)} recommandations récupérées d'une réponse tronquée")
+
+
+def test_model_router():
+    """Teste le routage des analyses selon la confiance du classement."""
+    print("\n" + "="*60)
+    print("TEST 7: Routage des modèles")
+    print("="*60)
+    
+    router = ModelRouter(deterministic_threshold=0.7, fast_threshold=0.4)
+    
+    def flight(flight_id, price, stops, duration):
+        return {"id": flight_id, "price": price, "stops": stops, "duration": duration}
+    
+    # Cinq vols directs, courts et bon marché dominent toutes les autres offres
+    obvious = [flight(f"FL{i}", 200 + i * 10, 0, "3h 0m") for i in range(5)]
+    obvious += [flight(f"FL{10 + i}", 600 + i * 50, 1, "7h 30m") for i in range(3)]
+    tier, confidence = router.route(obvious)
+    assert tier == TIER_DETERMINISTIC and confidence == 1.0
+    
+    # Les vols directs sont chers et longs : arbitrage nécessaire
+    ambiguous = [flight(f"FL{i}", 900 + i * 10, 0, "14h 0m") for i in range(5)]
+    ambiguous += [flight(f"FL{10 + i}", 200 + i * 10, 1, "6h 0m") for i in range(3)]
+    tier, confidence = router.route(ambiguous)
+    assert tier == TIER_FULL and confidence == 0.0
+    
+    # Compagnie préférée : ses vols passent en tête du classement déterministe
+    preferred = obvious + [dict(flight("FL20", 650, 1, "8h 0m"), airline="El Al")]
+    assert rank_flights(preferred, "el al")[0]["id"] == "FL20"
+    tier, confidence = router.route(preferred, "El Al")
+    assert tier == TIER_DETERMINISTIC and confidence == 1.0
+    
+    # Compagnie préférée absente du top 5 par prix : le cas n'est plus évident
+    with_preferred = ambiguous + [dict(flight("FL20", 950, 0, "14h 0m"), airline="El Al")]
+    tier, confidence = router.route(with_preferred, "El Al")
+    assert tier == TIER_FULL
+    
+    # Sur des vols générés, la recommandation n°1 sans IA respecte la préférence
+    flights = generate_mock_flights(origin="CDG", destination="JFK", date="2025-12-25", airline="Air France")
+    flights[-1]["airline"] = "Air France"  # Garantir au moins un vol de la compagnie
+    result = flight_analyzer._deterministic_recommendations(flights, "Air France")
+    assert result["recommendations"][0]["airline"] == "Air France"
+    
+    # Le mode de secours (échec de l'IA) applique le même classement
+    fallback = flight_analyzer._fallback_recommendations([dict(f) for f in flights], "Air France")
+    assert fallback["recommendations"][0]["airline"] == "Air France"
+    assert "Compagnie préférée" in fallback["recommendations"][0]["ai_analysis"]["highlights"]
+    
+    print("✅ Classement évident servi sans IA, cas ambigu envoyé au modèle complet")
+
+
+def test_search_service():
+    """Teste le cache, la déduplication et la recherche en lot."""
+    print("\n" + "="*60)
+    print("TEST 8: Service de recherche (cache et lots)")
+    print("="*60)
+    
+    service = SearchService(cache_ttl=60)
+    pipeline_runs = []
+    
+    # Pipeline simulé : évite l'appel à l'IA et compte les exécutions
+    async def fake_pipeline(search_params):
+        pipeline_runs.append(search_params)
+        await asyncio.sleep(0.05)
+        return {"search_params": search_params, "flights": [], "data": {"success": True}}
+    
+    service._run_pipeline = fake_pipeline
+    
+    async def scenario():
+        # Recherches identiques simultanées : un seul calcul
+        results = await asyncio.gather(*[
+            service.search("Paris", "London", "2025-12-25") for _ in range(3)
+        ])
+        assert len(pipeline_runs) == 1
+        assert all(r is results[0] for r in results)
+        
+        # Même recherche, saisie différemment : servie depuis le cache
+        cached = await service.search("CDG", "londres", "2025-12-25")
+        assert cached is results[0] and len(pipeline_runs) == 1
+        
+        specs = [
+            {"origin": "Paris", "destination": "Rome", "date": "2025-12-25"},
+            {"origin": "Paris", "destination": "London", "date": "2025-12-25"},
+            {"origin": "", "destination": "Rome", "date": "2025-12-25"}
+        ]
+        return [line async for line in service.search_many(specs, concurrency=2)]
+    
+    lines = dict(asyncio.run(scenario()))
+    assert sorted(lines) == [0, 1, 2]
+    assert lines[0]["status"] == "completed" and lines[1]["status"] == "completed"
+    assert lines[2]["status"] == "error"
+    assert len(pipeline_runs) == 2
+    
+    print(f"✅ {len(pipeline_runs)} exécutions du pipeline pour 7 recherches")
+
+
+def test_prompt_layout():
+    """Teste le préfixe statique du prompt et le suivi des tokens en cache."""
+    print("\n" + "="*60)
+    print("TEST 9: Préfixe de prompt et tokens en cache")
+    print("="*60)
+    
+    flights = generate_mock_flights(origin="CDG", destination="JFK", date="2025-12-25")
+    first = flight_analyzer._build_messages(flights, "CDG", "JFK", "2025-12-25", "")
+    second = flight_analyzer._build_messages(flights[:3], "TLV", "LHR", "2025-12-26", "El Al")
+    
+    # Le préfixe est le même objet, au contenu identique, à chaque appel
+    assert first[0] is second[0]
+    assert first[0].content == second[0].content
+    assert "TLV" not in second[0].content and "{" in second[0].content
+    
+    # La partie variable ne contient que les critères et les vols de la recherche
+    suffix = second[-1].content
+    assert len(second) == 2
+    for value in ("TLV", "LHR", "2025-12-26", "El Al", flights[0]["id"]):
+        assert value in suffix
+    assert "Critères de sélection" not in suffix and "Format de réponse" not in suffix
+    
+    cached_before = metrics.count("llm.prompt_tokens.cached")
+    total_before = metrics.count("llm.prompt_tokens.total")
+    usage = {
+        "input_tokens": 1500,
+        "output_tokens": 100,
+        "total_tokens": 1600,
+        "input_token_details": {"cache_read": 1024}
+    }
+    
+    # Réponse brute et réponse structurée (include_raw) sont toutes deux prises en compte
+    flight_analyzer._record_usage(AIMessage(content="", usage_metadata=usage))
+    flight_analyzer._record_usage({
+        "raw": AIMessage(content="", usage_metadata=usage),
+        "parsed": None,
+        "parsing_error": None
+    })
+    
+    assert metrics.count("llm.prompt_tokens.cached") - cached_before == 2048
+    assert metrics.count("llm.prompt_tokens.total") - total_before == 3000
+    
+    print("✅ Préfixe statique partagé, 2048 tokens en cache sur 3000 comptabilisés")
+
+
+class FakeSocketServer:
+    """Serveur Socket.IO simulé : enregistre les rooms et les messages émis."""
+
+    def __init__(self):
+        self.rooms = {}
+        self.emitted = []
+
+    async def enter_room(self, sid, room):
+        self.rooms.setdefault(room, set()).add(sid)
+
+    async def leave_room(self, sid, room):
+        self.rooms.get(room, set()).discard(sid)
+
+    async def emit(self, event, data, room=None):
+        self.emitted.append((event, data, room))
+
+
+def test_price_watch_service():
+    """Teste le partage des routes surveillées et le déclenchement des analyses."""
+    print("\n" + "="*60)
+    print("TEST 10: Surveillance des prix (abonnements partagés)")
+    print("="*60)
+
+    def make_flight(number, price):
+        return {
+            "id": f"FL{number}", "airline": "Air France", "stops": 0,
+            "price": price, "available_seats": 50, "duration": "1h 30m"
+        }
+
+    initial = [make_flight(1000 + i, 100 + 10 * i) for i in range(8)]
+
+    # Recherche simulée : évite l'appel à l'IA, peut être retenue par un verrou
+    release = {}
+    async def fake_pipeline(search_params):
+        if search_params["destination"] in release:
+            await release[search_params["destination"]].wait()
+        return {"search_params": search_params, "flights": initial,
+                "data": {"recommendations": [{"id": "FL1006"}]}}
+
+    fake_search = SearchService(cache_ttl=60)
+    fake_search._run_pipeline = fake_pipeline
+
+    # Rafraîchissements scénarisés : chaque étape transforme la liste précédente
+    refresh_calls = []
+    steps = [
+        # Prix modifié hors du top 5 et hors recommandation : pas d'analyse
+        lambda flights, next_id: [
+            {**f, "price": f["price"] + 5} if f["id"] == "FL1007" else f for f in flights
+        ],
+        # Vol recommandé retiré (hors top 5) et nouveau vol : analyse
+        lambda flights, next_id: [f for f in flights if f["id"] != "FL1006"]
+        + [make_flight(next_id, 500)],
+        # Un vol entre dans le top 5 : analyse
+        lambda flights, next_id: [
+            {**f, "price": 50} if f["id"] == "FL1007" else f for f in flights
+        ],
+        # Aucun changement : rien n'est envoyé
+        lambda flights, next_id: flights
+    ]
+
+    def fake_refresh(flights, airline=None, next_id=None):
+        refresh_calls.append((airline, next_id))
+        return steps.pop(0)(flights, next_id)
+
+    analyses = []
+    async def fake_analyze(flights, search_params):
+        analyses.append([f["id"] for f in flights])
+        return {"recommendations": [{"id": "FL1000"}]}
+
+    sio = FakeSocketServer()
+    service = PriceWatchService(sio, interval=0.01, top_k=5)
+    service._analyze = fake_analyze
+
+    original_search = price_watch.search_service
+    original_refresh = price_watch.refresh_mock_flights
+    price_watch.search_service = fake_search
+    price_watch.refresh_mock_flights = fake_refresh
+
+    params = {"origin": "Paris", "destination": "London",
+              "date": "2025-12-25", "airline": "Air France"}
+
+    async def scenario():
+        # Deux clients sur la même route : une room, un instantané, une tâche
+        first, second = await asyncio.gather(
+            service.subscribe("a", params),
+            service.subscribe("b", {**params, "origin": " paris "})
+        )
+        room = first["route"]
+        assert second["route"] == room and second["flights"] is first["flights"]
+        assert sio.rooms[room] == {"a", "b"}
+        assert list(service.tasks) == [room] and list(service.snapshots) == [room]
+
+        # Piloter les rafraîchissements à la main pendant le scénario
+        service.tasks[room].cancel()
+
+        update = await service.refresh_route(room)
+        assert update["changed"] == [{"id": "FL1007", "price": 175}]
+        assert "analysis" not in update and analyses == []
+
+        update = await service.refresh_route(room)
+        assert update["removed"] == ["FL1006"] and update["added"][0]["id"] == "FL1008"
+        assert "analysis" in update and len(analyses) == 1
+
+        update = await service.refresh_route(room)
+        assert "analysis" in update and len(analyses) == 2
+
+        assert await service.refresh_route(room) is None
+        assert len(analyses) == 2
+
+        # La compagnie de la route et un compteur d'IDs jamais réutilisé
+        assert refresh_calls == [("Air France", 1008), ("Air France", 1008),
+                                 ("Air France", 1009), ("Air France", 1009)]
+        assert service.snapshots[room]["version"] == 3
+
+        # Le dernier client parti, la route est libérée
+        await service.unsubscribe("a", room)
+        assert room in service.snapshots
+        await service.unsubscribe_all("b")
+        assert not service.tasks and not service.snapshots and not service.subscribers
+
+        # Désabonnement pendant la génération de l'instantané
+        release["FCO"] = asyncio.Event()
+        pending = asyncio.create_task(
+            service.subscribe("c", {**params, "destination": "Rome"})
+        )
+        await asyncio.sleep(0.01)
+        rome_room = PriceWatchService.route_room("Paris", "Rome", "2025-12-25", "Air France")
+        await service.unsubscribe("c", rome_room)
+        release["FCO"].set()
+        assert await pending is None
+        assert not service.tasks and not service.snapshots
+
+        return len(sio.emitted)
+
+    try:
+        emitted = asyncio.run(scenario())
+    finally:
+        price_watch.search_service = original_search
+        price_watch.refresh_mock_flights = original_refresh
+
+    assert emitted == 3
+    print(f"✅ {emitted} mises à jour envoyées, {len(analyses)} analyses relancées")
+
+
 def main():
     """Fonction principale de test."""
     print("\n" + "🧪 " * 20)
@@ -108,6 +494,27 @@ def main():
     # Test 3: Flight analyzer
     test_flight_analyzer(flights[:10])  # Tester avec 10 vols
     
+    # Test 4: Price watch
+    test_price_watch()
+    
+    # Test 5: Airport index
+    test_airport_index()
+    
+    # Test 6: Recommendation parser
+    test_recommendation_parser()
+    
+    # Test 7: Model router
+    test_model_router()
+    
+    # Test 8: Search service
+    test_search_service()
+    
+    # Test 9: Prompt layout
+    test_prompt_layout()
+    
+    # Test 10: Price watch service
+    test_price_watch_service()
+    
     print("\n" + "="*60)
     print("TESTS TERMINÉS")
     print("="*60)